@@ -0,0 +1,62 @@
+#Write-heavy throughput: a commit per statement against the async group-commit writer
+#usage: python -m benchmarks.db_write_benchmark [concurrent users] [messages per user]
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from helpers.database_connector import SQLiteConnector
+from helpers.history import init_history, append_message
+
+TEXT = "Some question about the weather, with a few words in it."
+
+
+#the old connector: a shared cursor and a commit after every statement, on the event loop
+async def per_statement(path, users, per_user):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE messages (user_id INTEGER, seq INTEGER, role TEXT, content TEXT, tokens INTEGER)")
+    cursor = connection.cursor()
+
+    async def user(id):
+        for seq in range(per_user):
+            cursor.execute("INSERT INTO messages VALUES (?,?,?,?,?)", (id, seq, 'user', TEXT, 15))
+            connection.commit()
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(user(id) for id in range(users)))
+    connection.close()
+
+
+async def group_commit(path, users, per_user, flush_latency):
+    db = SQLiteConnector(path, flush_latency=flush_latency)
+    await init_history(db)
+
+    async def user(id):
+        for _ in range(per_user):
+            await append_message(db, id, 'user', TEXT)
+
+    await asyncio.gather(*(user(id) for id in range(users)))
+    await db.close()
+
+
+async def main(users, per_user):
+    directory = tempfile.mkdtemp()
+    total = users * per_user
+    runs = [
+        ("commit per statement", per_statement(os.path.join(directory, "a.db"), users, per_user)),
+        ("group commit", group_commit(os.path.join(directory, "b.db"), users, per_user, 0)),
+        ("group commit, 2ms window", group_commit(os.path.join(directory, "c.db"), users, per_user, 0.002)),
+    ]
+    for name, run in runs:
+        start = time.perf_counter()
+        await run
+        elapsed = time.perf_counter() - start
+        print(f"{name:<26} {total / elapsed:10.0f} writes/s")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    users = int(args[0]) if len(args) > 0 else 200
+    per_user = int(args[1]) if len(args) > 1 else 50
+    asyncio.run(main(users, per_user))
@@ -0,0 +1,61 @@
+#Regression check: going through /start and the chat buttons again and again must not register handlers
+#the updates go through dp.feed_update, Telegram is the local stub
+#usage: python -m benchmarks.handler_check [--rounds N]
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from benchmarks import stub_openai, stub_telegram
+from benchmarks.load_test import Updates, FIRST_USER
+
+
+async def main(args) -> int:
+    telegram_runner, telegram_url = await stub_openai.serve(stub_telegram.create_app(0))
+
+    #config is read when the bot is imported, so the environment goes first
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "handler_check.db")
+    os.environ["TELEGRAM_TOKEN"] = "123456:stub-token"
+    os.environ["TELEGRAM_API_URL"] = telegram_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["METRICS_PORT"] = "0"
+    import bot as app
+    from aiogram.types import Update
+    from helpers import locales
+
+    async def feed(data: dict):
+        await app.dp.feed_update(app.bot, Update.model_validate(data, context={"bot": app.bot}))
+
+    updates = Updates()
+    flag = next(iter(locales.flags))
+    locale = locales.flags[flag]
+    observers = {name: len(observer.handlers) for name, observer in app.dp.observers.items()}
+
+    await app.dp.emit_startup(bot=app.bot)
+    try:
+        for _ in range(args.rounds):
+            await feed(updates.command(FIRST_USER, "/start"))
+            await feed(updates.text(FIRST_USER, flag))
+            await feed(updates.text(FIRST_USER, locales.text(locale, "start_chat")))
+            await feed(updates.text(FIRST_USER, locales.text(locale, "end_chat")))
+            #back to no state, so the next /start is handled by button_start again
+            await feed(updates.command(FIRST_USER, "/clear_state"))
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot)
+        await app.bot.session.close()
+        await telegram_runner.cleanup()
+
+    status = 0
+    for name, observer in app.dp.observers.items():
+        if len(observer.handlers) != observers[name]:
+            print(f"{name} handlers grew from {observers[name]} to {len(observer.handlers)}")
+            status = 1
+    if not status:
+        print(f"{args.rounds} rounds of /start, handlers unchanged: {observers['message']} message handlers")
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Checks that handlers are registered only once")
+    parser.add_argument("--rounds", type=int, default=5)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,72 @@
+#Per-turn latency of the legacy users.chat blob against the messages table
+#usage: python -m benchmarks.history_benchmark
+import ast
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from helpers.database_connector import SQLiteConnector
+from helpers.history import init_history, append_message, load_window
+
+SIZES = (10, 100, 1000)
+TURNS = 50
+TEXT = "Some question about the weather, with a few words in it. " * 4
+
+
+#the old connector: one shared cursor and a commit after every statement
+def legacy_save(connection, id, role, text):
+    text = str({'role': role, 'content': text}) + "\n" + "#123#"
+    connection.execute("UPDATE users SET chat = chat || ? WHERE id = ?", (text, id))
+    connection.commit()
+
+
+def legacy_load(connection, id):
+    request_db = "".join(connection.execute("SELECT chat FROM users WHERE id = ?", (id,)).fetchone()).split('#123#')
+    request_db.pop()
+    return [ast.literal_eval(item) for item in request_db]
+
+
+def legacy_turn(connection, id):
+    legacy_save(connection, id, 'user', TEXT)
+    legacy_load(connection, id)
+    legacy_save(connection, id, 'assistant', TEXT)
+
+
+async def table_turn(db, id):
+    await append_message(db, id, 'user', TEXT)
+    await load_window(db, id)
+    await append_message(db, id, 'assistant', TEXT)
+
+
+async def main():
+    directory = tempfile.mkdtemp()
+    connection = sqlite3.connect(os.path.join(directory, "legacy.db"))
+    connection.execute("CREATE TABLE users (id INT not NULL, chat TEXT, language TEXT)")
+    db = SQLiteConnector(os.path.join(directory, "messages.db"))
+    await init_history(db)
+
+    print(f"{'stored':>8} {'legacy ms/turn':>15} {'table ms/turn':>14}")
+    for id, size in enumerate(SIZES):
+        connection.execute("INSERT INTO users (id, chat, language) VALUES (?,?,?)", (id, "", "en"))
+        for i in range(size):
+            role = 'user' if i % 2 == 0 else 'assistant'
+            legacy_save(connection, id, role, TEXT)
+            await append_message(db, id, role, TEXT)
+
+        start = time.perf_counter()
+        for _ in range(TURNS):
+            legacy_turn(connection, id)
+        legacy = (time.perf_counter() - start) / TURNS * 1000
+
+        start = time.perf_counter()
+        for _ in range(TURNS):
+            await table_turn(db, id)
+        table = (time.perf_counter() - start) / TURNS * 1000
+        print(f"{size:>8} {legacy:>15.3f} {table:>14.3f}")
+    await db.close()
+    connection.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,304 @@
+#Offline load test: the real dispatcher and handlers, stub Telegram and OpenAI servers
+#every scenario sends one update per simulated user at once and reports
+#throughput, handler latency percentiles and the time spent in SQLite
+#the webhook scenarios POST the updates to run_webhook and run_sharded on a local port,
+#their latency is the time to the HTTP answer and the throughput counts until every user got a reply
+#usage: python -m benchmarks.load_test [--users N] [--telegram-latency S] [--openai-latency S] [--webhook-workers N] [--save]
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import aiohttp
+from benchmarks import stub_openai, stub_telegram
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+#a scenario regresses when it is this much slower than the baseline
+TOLERANCE = 0.2
+#ids of the simulated users start here
+FIRST_USER = 100000
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = "load-test"
+#seconds a webhook scenario waits for the replies
+REPLY_TIMEOUT = 120
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+#Sums the time spent in the database calls of the connector
+class DatabaseTimer:
+    def __init__(self, db):
+        self.total = 0.0
+        for name in ("execute_query", "fetch_data_one", "fetch_data_all"):
+            setattr(db, name, self._wrap(getattr(db, name)))
+
+    def _wrap(self, call):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - start
+        return timed
+
+
+class Updates:
+    def __init__(self):
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    def message(self, user: int, **content) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user, "type": "private"},
+                "from": {"id": user, "is_bot": False, "first_name": f"User {user}"},
+                **content
+            }
+        }
+
+    def text(self, user: int, text: str) -> dict:
+        return self.message(user, text=text)
+
+    def command(self, user: int, command: str) -> dict:
+        return self.message(user, text=command, entities=[{"type": "bot_command", "offset": 0, "length": len(command)}])
+
+    def voice(self, user: int) -> dict:
+        return self.message(user, voice={"file_id": f"voice-{user}", "file_unique_id": f"voice-{user}", "duration": 2})
+
+
+async def run_scenario(app, timer: DatabaseTimer, name: str, updates: list) -> dict:
+    latencies = []
+    errors = 0
+
+    async def feed(update):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await app.dp.feed_raw_update(app.bot, update)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    db_before = timer.total
+    start = time.perf_counter()
+    await asyncio.gather(*(feed(update) for update in updates))
+    elapsed = time.perf_counter() - start
+    return result(name, updates, errors, elapsed, latencies, timer.total - db_before)
+
+
+def result(name: str, updates: list, errors: int, elapsed: float, latencies: list, sqlite: float) -> dict:
+    return {
+        "scenario": name,
+        "updates": len(updates),
+        "errors": errors,
+        "throughput": len(updates) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "sqlite_ms": sqlite * 1000,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+        else:
+            writer.close()
+            return
+
+
+#POSTs the updates to a webhook server, every one of them is a prompt answered with a new message
+async def post_scenario(session, url: str, telegram, timer: DatabaseTimer, name: str, updates: list) -> dict:
+    latencies = []
+    errors = 0
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+
+    async def post(update):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            async with session.post(url, json=update, headers=headers) as response:
+                if response.status != 200:
+                    errors += 1
+        except aiohttp.ClientError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    calls = telegram["calls"]
+    replies = calls.get("sendMessage", 0) + len(updates)
+    db_before = timer.total
+    start = time.perf_counter()
+    await asyncio.gather(*(post(update) for update in updates))
+    #the updates are handled in the background, waiting for their replies
+    deadline = time.monotonic() + REPLY_TIMEOUT
+    while calls.get("sendMessage", 0) < replies and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    errors += max(0, replies - calls.get("sendMessage", 0))
+    return result(name, updates, errors, elapsed, latencies, timer.total - db_before)
+
+
+#one process, aiogram's own request handler
+async def webhook_scenario(app, session, telegram, timer: DatabaseTimer, updates: list) -> dict:
+    from helpers import webhook
+    port = free_port()
+    server = asyncio.create_task(
+        webhook.run_webhook(app.dp, app.bot, "127.0.0.1", port, WEBHOOK_PATH, WEBHOOK_SECRET)
+    )
+    try:
+        await wait_for_port(port)
+        url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+        found = await post_scenario(session, url, telegram, timer, "webhook", updates)
+        #the answers are still streamed, the server shuts the dispatcher down when it stops
+        while app.prompts.users:
+            await asyncio.sleep(0.01)
+        return found
+    finally:
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+
+#SQLite seconds of the worker processes so far, read from their metrics endpoints
+async def worker_sqlite(session, ports: list) -> float:
+    total = 0.0
+    for port in ports:
+        async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+            for line in (await response.text()).splitlines():
+                if line.startswith("bot_db_query_seconds_sum"):
+                    total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+#worker processes behind the forwarding front, they start their own bots first
+#the SQLite work happens in the workers, its time comes from their metrics
+async def sharded_scenario(app, session, telegram, timer: DatabaseTimer, workers: int, warm_up: list, updates: list) -> dict:
+    from helpers import webhook
+    port = free_port()
+    #worker N serves its metrics on METRICS_PORT + N + 1, the new processes read it when they import the bot
+    metrics_port = free_port()
+    os.environ["METRICS_HOST"] = "127.0.0.1"
+    os.environ["METRICS_PORT"] = str(metrics_port)
+    metrics_ports = [metrics_port + index + 1 for index in range(workers)]
+    server = asyncio.create_task(
+        webhook.run_sharded(app.worker, workers, "127.0.0.1", port, WEBHOOK_PATH, WEBHOOK_SECRET)
+    )
+    try:
+        await wait_for_port(port)
+        url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+        #one prompt for every worker, so the scenario doesn't time their start
+        await post_scenario(session, url, telegram, timer, "warm-up", warm_up)
+        sqlite_before = await worker_sqlite(session, metrics_ports)
+        found = await post_scenario(session, url, telegram, timer, f"sharded_{workers}", updates)
+        found["sqlite_ms"] = (await worker_sqlite(session, metrics_ports) - sqlite_before) * 1000
+        return found
+    finally:
+        os.environ["METRICS_PORT"] = "0"
+        #the workers finish the updates they have before they stop
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+
+async def main(args) -> int:
+    telegram = stub_telegram.create_app(args.telegram_latency)
+    telegram_runner, telegram_url = await stub_openai.serve(telegram)
+    openai_runner, openai_url = await stub_openai.serve(stub_openai.create_app(args.openai_latency))
+
+    #config is read when the bot is imported, so the environment goes first
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "load_test.db")
+    os.environ["TELEGRAM_TOKEN"] = "123456:stub-token"
+    os.environ["TELEGRAM_API_URL"] = telegram_url
+    os.environ["OPENAI_BASE_URL"] = openai_url + "/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["METRICS_PORT"] = "0"
+    import bot as app
+    from helpers import locales
+
+    await app.dp.emit_startup(bot=app.bot)
+    timer = DatabaseTimer(app.db)
+
+    users = range(FIRST_USER, FIRST_USER + args.users)
+    updates = Updates()
+    flags = list(locales.flags)
+    handlers = len(app.dp.message.handlers)
+
+    results = []
+    try:
+        results.append(await run_scenario(app, timer, "start", [updates.command(u, "/start") for u in users]))
+        results.append(await run_scenario(app, timer, "language", [updates.text(u, flags[u % len(flags)]) for u in users]))
+        results.append(await run_scenario(app, timer, "start_chat", [
+            updates.text(u, locales.text(locales.flags[flags[u % len(flags)]], "start_chat")) for u in users
+        ]))
+        results.append(await run_scenario(app, timer, "text", [updates.text(u, f"Question number {u}") for u in users]))
+        results.append(await run_scenario(app, timer, "voice", [updates.voice(u) for u in users]))
+        async with aiohttp.ClientSession() as session:
+            if args.webhook_workers > 1:
+                warm_up = [updates.text(u, f"Warm-up {u}") for u in users[:args.webhook_workers]]
+                results.append(await sharded_scenario(
+                    app, session, telegram, timer, args.webhook_workers, warm_up,
+                    [updates.text(u, f"Sharded question {u}") for u in users]
+                ))
+            #last, stopping the server shuts the dispatcher down
+            results.append(await webhook_scenario(
+                app, session, telegram, timer, [updates.text(u, f"Webhook question {u}") for u in users]
+            ))
+    finally:
+        await app.dp.emit_shutdown(bot=app.bot)
+        await app.bot.session.close()
+        await openai_runner.cleanup()
+        await telegram_runner.cleanup()
+
+    print_results(results)
+    status = 0
+
+    #handlers are registered once, /start must not add any
+    if len(app.dp.message.handlers) != handlers:
+        print(f"message handlers grew from {handlers} to {len(app.dp.message.handlers)}")
+        status = 1
+
+    if args.save:
+        with open(BASELINE_PATH, "w") as file:
+            json.dump({r["scenario"]: r for r in results}, file, indent=4)
+        print(f"baseline saved to {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            found = regressions(results, json.load(file))
+        for line in found:
+            print("REGRESSION", line)
+        if found:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline load test of the bot")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--webhook-workers", type=int, default=2, help="workers of the sharded scenario, 1 skips it")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    sys.exit(asyncio.run(main(parser.parse_args())))
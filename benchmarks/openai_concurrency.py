@@ -0,0 +1,37 @@
+#Shows that concurrent users are served in parallel by the async OpenAI layer
+#usage: python -m benchmarks.openai_concurrency [users] [requests per user] [latency]
+import asyncio
+import os
+import sys
+import time
+from benchmarks import stub_openai
+
+
+async def run(users: int, per_user: int, latency: float):
+    runner, url = await stub_openai.serve(stub_openai.create_app(latency))
+    os.environ["OPENAI_BASE_URL"] = url + "/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    #imported after the environment is ready, config is read on import
+    from helpers import openai_client
+
+    async def user(id):
+        for _ in range(per_user):
+            await openai_client.complete(id, [{"role": "user", "content": "hi"}])
+
+    try:
+        for n in (1, users):
+            start = time.perf_counter()
+            await asyncio.gather(*(user(id) for id in range(n)))
+            elapsed = time.perf_counter() - start
+            print(f"{n:>5} users: {n * per_user / elapsed:8.2f} requests/s ({elapsed:.2f}s)")
+    finally:
+        await openai_client.client.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    users = int(args[0]) if len(args) > 0 else 20
+    per_user = int(args[1]) if len(args) > 1 else 5
+    latency = float(args[2]) if len(args) > 2 else 0.2
+    asyncio.run(run(users, per_user, latency))
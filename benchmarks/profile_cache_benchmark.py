@@ -0,0 +1,61 @@
+#Cost of the profile data for one message: database and fresh keyboards against the cache
+#usage: python -m benchmarks.profile_cache_benchmark
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import i18n
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from helpers.cache import TTLCache, MISSING
+from helpers import locales
+
+MESSAGES = 20000
+USERS = 1000
+
+
+async def uncached_message(connection, id):
+    #what get_prompt used to do: two lookups, a translation and a new keyboard
+    language = connection.execute("SELECT language FROM users WHERE id = ?", (id,)).fetchone()[0]
+    text = i18n.t("you_are_welcome", locale=language)
+    language = connection.execute("SELECT language FROM users WHERE id = ?", (id,)).fetchone()[0]
+    button = KeyboardButton(text=i18n.t("end_chat", locale=language))
+    return text, ReplyKeyboardMarkup(keyboard=[[button]], resize_keyboard=True, one_time_keyboard=True)
+
+
+async def cached_message(connection, profiles, id):
+    language = profiles.get(id)
+    if language is MISSING:
+        language = connection.execute("SELECT language FROM users WHERE id = ?", (id,)).fetchone()[0]
+        profiles.set(id, language)
+    return locales.text(language, "you_are_welcome"), locales.keyboard(language, "end_chat")
+
+
+async def measure(handle):
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        await handle(i % USERS)
+    return (time.perf_counter() - start) / MESSAGES * 1e6
+
+
+async def main():
+    i18n.load_path.append('locales')
+    i18n.set('file_format', 'json')
+    i18n.set('filename_format', '{locale}.{format}')
+    locales.build('locales')
+
+    connection = sqlite3.connect(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    connection.execute("CREATE TABLE users (id INT not NULL, chat TEXT, language TEXT)")
+    for id in range(USERS):
+        connection.execute("INSERT INTO users (id, chat, language) VALUES (?,?,?)", (id, "", "en" if id % 2 else "ua"))
+    connection.commit()
+    profiles = TTLCache(USERS, 3600)
+
+    uncached = await measure(lambda id: uncached_message(connection, id))
+    cached = await measure(lambda id: cached_message(connection, profiles, id))
+    print(f"uncached: {uncached:8.2f} us/message")
+    print(f"cached:   {cached:8.2f} us/message")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+#Local stand-in for the OpenAI chat and transcription endpoints
+#every request waits `latency` seconds, so concurrency can be measured without a real key
+import asyncio
+import json
+import time
+from aiohttp import web
+
+
+def chat_completion(model, content):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+    }
+
+
+def chat_chunk(model, content):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"content": content},
+            "finish_reason": None
+        }]
+    }
+
+
+#the latency is spread over the pieces of a streamed answer
+async def stream_completion(request, model, reply, latency):
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    words = reply.split(" ")
+    for i, word in enumerate(words):
+        await asyncio.sleep(latency / len(words))
+        content = word if i == 0 else " " + word
+        await response.write(f"data: {json.dumps(chat_chunk(model, content))}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def create_app(latency: float = 0.2, reply: str = "Stub answer."):
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["requests"] = 0
+
+    async def chat_completions(request: web.Request):
+        body = await request.json()
+        app["requests"] += 1
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            return await stream_completion(request, model, reply, latency)
+        await asyncio.sleep(latency)
+        return web.json_response(chat_completion(model, reply))
+
+    async def transcriptions(request: web.Request):
+        await request.read()
+        app["requests"] += 1
+        await asyncio.sleep(latency)
+        return web.Response(text="Transcribed voice message.")
+
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/audio/transcriptions", transcriptions)
+    return app
+
+
+#starts an app on a free local port, returns the runner and the url of the server
+#the OpenAI base_url is this url + "/v1"
+async def serve(app: web.Application, host: str = "127.0.0.1", port: int = 0):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
@@ -0,0 +1,55 @@
+#Local stand-in for the Telegram Bot API, answers every method with a plausible result
+#every request waits `latency` seconds
+import asyncio
+import itertools
+import time
+from aiohttp import web
+
+#a few bytes are enough, the OpenAI stub doesn't look at the audio
+VOICE_BYTES = b"OggS" + bytes(2048)
+
+
+def create_app(latency: float = 0.02):
+    app = web.Application()
+    app["calls"] = {}
+    message_ids = itertools.count(1)
+
+    def message(data, text):
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+            "text": text
+        }
+
+    async def method(request: web.Request):
+        name = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        app["calls"][name] = app["calls"].get(name, 0) + 1
+        await asyncio.sleep(latency)
+
+        if name in ("sendMessage", "editMessageText"):
+            result = message(data, data.get("text", ""))
+        elif name == "getFile":
+            result = {
+                "file_id": data.get("file_id", ""),
+                "file_unique_id": "stub",
+                "file_size": len(VOICE_BYTES),
+                "file_path": "voice/stub.oga"
+            }
+        elif name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request: web.Request):
+        await asyncio.sleep(latency)
+        return web.Response(body=VOICE_BYTES)
+
+    app.router.add_post("/bot{token}/{method}", method)
+    app.router.add_get("/file/bot{token}/{path:.+}", download)
+    return app
@@ -1,57 +1,60 @@
 import asyncio
+import os
+import time
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command, StateFilter
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton 
 from aiogram import F
 from aiogram.fsm.context import FSMContext
 import i18n
 from helpers.helpers import (
-    File, get_language,
-    transcipt_file, initialize_languages,
-    ask_and_save, downloader
+    db, get_language, set_language, add_user,
+    ask_and_save, ask_and_stream, voice_pipeline
     )
-from helpers.database_connector import SQLiteConnector
-
-filearray = [File(),File(),File(),File(),File()]
-
-
+from helpers.streaming import StreamingReply
+from helpers.history import init_history, migrate_legacy_chat, clear_history
+from helpers.fsm_storage import SQLiteStorage
+from helpers.user_queue import UserSerializer
+from helpers.instrumentation import MetricsMiddleware, serve_metrics, log_summary
+from helpers import locales, config, metrics, webhook
 
 #locales, json preferable, removing namespace
-i18n.load_path.append('locales')
+LOCALES_PATH = os.path.join(config.BASE_DIR, 'locales')
+i18n.load_path.append(LOCALES_PATH)
 i18n.set('file_format', 'json')
 i18n.set('filename_format', '{locale}.{format}')
-
-
-#database connect
-db = SQLiteConnector("database\\users.db")
+#strings and keyboards for every locale are built once
+locales.build(LOCALES_PATH)
 
 
 #key for openaiprompt in the helpers.py
 
 #telegram key
-TOKEN_API = ""
-bot = Bot(TOKEN_API)
+TOKEN_API = config.TELEGRAM_TOKEN
+session = None
+if config.TELEGRAM_API_URL:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+bot = Bot(TOKEN_API, session=session)
 
-dp = Dispatcher()
+#states are kept in the database, so they survive a restart
+storage = SQLiteStorage(db, config.FSM_CACHE_SIZE, config.FSM_CACHE_TTL)
+dp = Dispatcher(storage=storage)
+#latency and errors of every handler
+dp.message.middleware(MetricsMiddleware())
+#every worker of the sharded webhook mode gets its own port
+metrics_port = config.METRICS_PORT
+background = {}
 
-#BUTTONS AND KEYBOARDS
-def start_chat_kb(id):
-    button_start_chat = KeyboardButton(text=i18n.t("start_chat", locale=get_language(id)))
-    return ReplyKeyboardMarkup(keyboard=[[button_start_chat]],resize_keyboard=True, one_time_keyboard=True)
-def end_chat_kb(id):
-    button_end_chat = KeyboardButton(text=i18n.t("end_chat", locale=get_language(id)))
-    return ReplyKeyboardMarkup(keyboard=[[button_end_chat]],resize_keyboard=True, one_time_keyboard=True)
-
-language_kb = initialize_languages()
+#KEYBOARDS
+language_kb = locales.language_keyboard()
 
 
 #First call for the buttons to appear
 @dp.message(F.text, Command("start"), StateFilter(None))
 async def button_start(message: types.Message, state:FSMContext):
     id = message.from_user.id
-    current = db.fetch_data_one("SELECT id FROM users WHERE id = ?", (id,))
-    if current is None: db.execute_query("INSERT INTO users (id, chat, language) VALUES (?,?,?)", (id, "", ""))
-    route_initialization()
+    await add_user(id)
     await state.set_state("Language_select")
     await message.reply("First of all, select your language!", reply_markup = language_kb)
 
@@ -64,20 +67,17 @@ async def mistake_handler(message: types.Message):
 
 @dp.message(F.photo | F.sticker | F.video | F.document)
 async def wrong_type_handler(message: types.Message):
-    await message.reply(text=i18n.t("support", locale=get_language(message.from_user.id)))
+    await message.reply(text=locales.text(await get_language(message.from_user.id), "support"))
 
 
 @dp.message(F.text, StateFilter("Language_select"))
 async def language_switch(message: types.Message, state: FSMContext):
     id = message.from_user.id
-    if message.text == u"\U0001F1FA\U0001F1E6":#ukraine unicode
-        ln = 'ua'
-    else:
-        ln = 'en'
-    db.execute_query("UPDATE users SET language = ? WHERE id = ?", (ln, id))
+    ln = locales.locale_by_flag(message.text)
+    await set_language(id, ln)
     await state.clear()
     await state.set_state("Ready")
-    await message.reply(i18n.t("select", locale=ln), reply_markup=start_chat_kb(id))
+    await message.reply(locales.text(ln, "select"), reply_markup=locales.keyboard(ln, "start_chat"))
 
 
 @dp.message(F.text, Command("clear_state"))
@@ -85,71 +85,131 @@ async def clear_state_f(message: types.Message, state: FSMContext):
     await state.clear()
 
 
-#route for handling the button press
-#@dp.message(F.text == i18n.t("start_chat"), StateFilter("Ready"))
+#route for handling the button press, in any locale
+@dp.message(F.text.in_(locales.button_texts("start_chat")), StateFilter("Ready"))
 async def get_prompt(message: types.Message, state: FSMContext):
-    id = message.from_user.id
-    await message.reply(i18n.t("you_are_welcome", locale=get_language(id)), reply_markup = end_chat_kb(id))
+    ln = await get_language(message.from_user.id)
+    await message.reply(locales.text(ln, "you_are_welcome"), reply_markup = locales.keyboard(ln, "end_chat"))
     await state.clear()
     await state.set_state("waiting for prompt")
 
 
-#@dp.message(F.text == i18n.t("end_chat"), StateFilter("waiting for prompt"))
+@dp.message(F.text.in_(locales.button_texts("end_chat")), StateFilter("waiting for prompt"))
 async def end_chat(message: types.Message, state: FSMContext):
     id = message.from_user.id
-    db.execute_query("UPDATE users SET chat = ? WHERE id = ?", ("", id))
-    await message.reply(i18n.t("finish",locale=get_language(id)), reply_markup = start_chat_kb(id))
+    ln = await get_language(id)
+    #prompts sent before the button aren't answered into the new chat
+    await prompts.drop(id)
+    await clear_history(db, id)
+    await message.reply(locales.text(ln, "finish"), reply_markup = locales.keyboard(ln, "start_chat"))
     await state.clear()
     await state.set_state("Ready")
 
 
 #function for handling my input after prompt button has been used
-#@dp.message(F.text, StateFilter("waiting for prompt"))
+@dp.message(F.text, StateFilter("waiting for prompt"))
 async def text_handler(message: types.Message, state: FSMContext):
     id = message.from_user.id
     request = message.text
-    result = ask_and_save(request, id)
-    await message.reply(result, parse_mode="MarkdownV2")
+    await prompts.submit(id, message, request)
 
     
-#@dp.message(F.voice, StateFilter("waiting for prompt"))
+@dp.message(F.voice, StateFilter("waiting for prompt"))
 async def voice_handler(message: types.Message,  state: FSMContext):
     id = message.from_user.id
-    checkFree = await downloader(bot, filearray, message)
-    with open (checkFree[1], 'rb+') as audio_message:
-        audio_text = transcipt_file(audio_message)
-        filearray[checkFree[0]].switch()
+    #transcribing right away, the answer still comes in the order of the messages
+    audio_text = asyncio.ensure_future(voice_pipeline.submit(bot, message))
+    await prompts.submit(id, message, audio_text)
+
+
+#answering the prompt, streamed or in one piece
+#`received` is when the first prompt of the batch came, before the wait for the rest and the transcription
+async def respond(message: types.Message, request, id, received: float):
+    if config.STREAM_REPLIES:
+        reply = StreamingReply(message, config.STREAM_EDIT_INTERVAL, received)
+        await reply.start()
+        try:
+            await ask_and_stream(request, id, reply)
+        except Exception:
+            await reply.fail(locales.text(await get_language(id), "error"))
+            raise
+    else:
+        result = await ask_and_save(request, id)
+        await message.reply(result, parse_mode="MarkdownV2")
+        metrics.time_to_first_token.observe(time.perf_counter() - received)
 
-    result = ask_and_save(audio_text, id)
-    
-    await message.reply(result, parse_mode="MarkdownV2")
+
+#prompts of every user are answered in order, a burst of them with one completion
+prompts = UserSerializer(respond, config.COALESCE_WINDOW, config.COALESCE_MAX_DELAY)
 
 
 @dp.message(F.text, Command("use"), StateFilter("Ready"))
 async def print_info(message: types.Message):
-    id = message.from_user.id
-    data = (i18n.t("use", locale = get_language(id)))
+    data = locales.text(await get_language(message.from_user.id), "use")
     await message.answer(data)
 
 
 @dp.message(F.text, Command("info"), StateFilter("Ready"))
 async def print_info(message: types.Message):
-    id = message.from_user.id
-    data = (i18n.t("info", locale = get_language(id)))
+    data = locales.text(await get_language(message.from_user.id), "info")
     await message.answer(data)
 
-#defining routes for locales
-def route_initialization():
-    dp.message.register(get_prompt, F.text == i18n.t("start_chat", locale='en'), StateFilter("Ready"))
-    dp.message.register(get_prompt, F.text == i18n.t("start_chat", locale='ua'), StateFilter("Ready"))
-    dp.message.register(end_chat, F.text == i18n.t("end_chat",locale='en'), StateFilter("waiting for prompt"))
-    dp.message.register(end_chat, F.text == i18n.t("end_chat",locale='ua'), StateFilter("waiting for prompt"))
-    dp.message.register(text_handler, F.text, StateFilter("waiting for prompt"))
-    dp.message.register(voice_handler, F.voice, StateFilter("waiting for prompt"))
+#database connect, the history table and the legacy chat migration
+async def on_startup():
+    db.start()
+    voice_pipeline.start()
+    await init_history(db)
+    await storage.init()
+    await migrate_legacy_chat(db)
+    if metrics_port:
+        background["metrics"] = await serve_metrics(config.METRICS_HOST, metrics_port)
+    if config.METRICS_LOG_INTERVAL:
+        background["summary"] = asyncio.create_task(log_summary(config.METRICS_LOG_INTERVAL))
+
+
+async def on_shutdown():
+    if "summary" in background:
+        background.pop("summary").cancel()
+    if "metrics" in background:
+        await background.pop("metrics").cleanup()
+    await voice_pipeline.close()
+    await db.close()
+
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+
+#worker process of the sharded webhook mode
+def worker(queue, index):
+    global metrics_port
+    if metrics_port:
+        metrics_port += index + 1
+    asyncio.run(webhook.run_shard(dp, bot, queue))
 
 
 async def main():
-    await dp.start_polling(bot)
+    if config.BOT_MODE != "webhook":
+        await dp.start_polling(bot)
+        return
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            config.WEBHOOK_URL + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET or None,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS
+        )
+    if config.WEBHOOK_WORKERS > 1:
+        #the workers have their own bots, this one isn't needed anymore
+        await bot.session.close()
+        await webhook.run_sharded(
+            worker, config.WEBHOOK_WORKERS,
+            config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH, config.WEBHOOK_SECRET
+        )
+    else:
+        await webhook.run_webhook(
+            dp, bot,
+            config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH, config.WEBHOOK_SECRET
+        )
 
 
 if __name__ == '__main__':
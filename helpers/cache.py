@@ -0,0 +1,36 @@
+import time
+from collections import OrderedDict
+
+#returned by get() when there is nothing cached, None can be a cached value
+MISSING = object()
+
+
+#Bounded cache: the least recently used key goes first, every key expires after `ttl` seconds
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        #key -> (expiry time, value)
+        self.data = OrderedDict()
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return MISSING
+        if entry[0] < time.monotonic():
+            del self.data[key]
+            return MISSING
+        self.data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key):
+        self.data.pop(key, None)
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,93 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Settings are read from the environment, defaults are good for a single local bot
+
+#openAI
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+#None means the official endpoint, point it to a local stub for testing
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+#seconds for a single request, retries are done with exponential backoff
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "3"))
+#requests in flight: for the whole bot and for every single user
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_PER_USER = int(os.environ.get("OPENAI_MAX_PER_USER", "1"))
+
+#context window
+#prompt tokens per model, CONTEXT_BUDGET overrides it for every model
+CONTEXT_BUDGETS = {
+    "gpt-3.5-turbo": 3500,
+    "gpt-3.5-turbo-16k": 14000,
+    "gpt-4": 7000,
+    "gpt-4-32k": 30000,
+    "gpt-4-turbo": 120000,
+    "gpt-4o": 120000,
+}
+CONTEXT_BUDGET = int(os.environ.get("CONTEXT_BUDGET", "0"))
+#system prompt sent before the history, empty means none
+SYSTEM_PROMPT = os.environ.get("SYSTEM_PROMPT", "")
+#pinned system prompt is always kept, otherwise it is dropped with the oldest messages
+PIN_SYSTEM_PROMPT = os.environ.get("PIN_SYSTEM_PROMPT", "1") == "1"
+
+#user profiles cached in memory
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "3600"))
+
+#database
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(BASE_DIR, "database", "users.db"))
+#threads for reading, writes always go through a single writer
+DB_READERS = int(os.environ.get("DB_READERS", "4"))
+#statements committed together at most, and seconds the writer waits to group them
+DB_BATCH_SIZE = int(os.environ.get("DB_BATCH_SIZE", "256"))
+DB_FLUSH_LATENCY = float(os.environ.get("DB_FLUSH_LATENCY", "0"))
+
+#voice messages
+#transcriptions running at once and voice messages waiting for them
+VOICE_WORKERS = int(os.environ.get("VOICE_WORKERS", "4"))
+VOICE_QUEUE_SIZE = int(os.environ.get("VOICE_QUEUE_SIZE", "64"))
+
+#replies
+#show the answer while it is generated, editing the reply
+STREAM_REPLIES = os.environ.get("STREAM_REPLIES", "1") == "1"
+#seconds between edits of one reply, Telegram limits how often a message can be edited
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.0"))
+
+#telegram
+TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN", "")
+#empty means the official Bot API, point it to a local server or a stub for testing
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "")
+#FSM states cached in memory in front of the database
+FSM_CACHE_SIZE = int(os.environ.get("FSM_CACHE_SIZE", "10000"))
+FSM_CACHE_TTL = float(os.environ.get("FSM_CACHE_TTL", "3600"))
+
+#"polling" or "webhook"
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+#address the webhook server listens on
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+#public url Telegram sends the updates to, without the path; empty leaves the webhook as it is
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+#connections Telegram opens to the webhook at once, 1-100
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+#processes handling the updates, every user always goes to the same one
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "1"))
+
+#prompts of one user
+#seconds of quiet after which the texts sent so far are answered together, 0 answers every text
+COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW", "0.5"))
+#the first text of a burst is never kept waiting longer than this
+COALESCE_MAX_DELAY = float(os.environ.get("COALESCE_MAX_DELAY", "2"))
+
+#metrics
+#Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics, off by default because the labels hold user ids
+#to opt in set METRICS_PORT, e.g. 9090, and METRICS_HOST=0.0.0.0 only when the scraper isn't on this machine
+#worker N of the sharded webhook mode uses METRICS_PORT + N + 1
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+#seconds between summaries in the log, 0 turns them off
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", "0"))
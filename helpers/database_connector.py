@@ -1,26 +1,151 @@
+import asyncio
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from helpers import metrics
 
+
+#Async access to SQLite in WAL mode
+#reads run on a small thread pool, every thread has its own connection
+#writes go through one queue into a single writer thread and are committed in groups
 class SQLiteConnector:
-    _instance = None
-    
-    def __new__(cls, database_path):
-        if not cls._instance:
-            cls._instance = super(SQLiteConnector, cls).__new__(cls)
-            cls._instance.connection = sqlite3.connect(database_path)
-            cls._instance.cursor = cls._instance.connection.cursor()
-        return cls._instance
-
-    def execute_query(self, query, parameters=None):
-        if parameters:
-            self.cursor.execute(query, parameters)
-        else:
-            self.cursor.execute(query)
-        self.connection.commit()
-        return self.cursor
-
-    def fetch_data_one(self, query, parameters=None):
-        if parameters:
-            self.cursor.execute(query, parameters)
-        else:
-            self.cursor.execute(query)
-        return self.cursor.fetchone()
\ No newline at end of file
+    def __init__(self, database_path, readers=4, batch_size=256, flush_latency=0.0):
+        self.database_path = database_path
+        self.batch_size = batch_size
+        #how long the writer waits for more statements before a commit,
+        #with 0 a batch is whatever got queued while the previous commit was running
+        self.flush_latency = flush_latency
+        self.read_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sqlite-read")
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.queue = None
+        self.writer = None
+
+    #connection of the current thread
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def start(self):
+        if self.writer is None:
+            self.queue = asyncio.Queue()
+            self.writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self.writer is not None:
+            #letting the writer finish everything that is queued
+            await self.queue.join()
+            self.writer.cancel()
+            self.writer = None
+        self.read_pool.shutdown()
+        self.write_pool.shutdown()
+        for connection in self.connections:
+            connection.close()
+        self.connections.clear()
+
+    #Writes
+    async def execute_query(self, query, parameters=None):
+        self.start()
+        with metrics.Timer(metrics.db_query_latency, metrics.db_errors, ("write",)):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((query, parameters, future))
+            return await future
+
+    #Runs `function(connection, *args)` in the writer thread as one unit of the batch,
+    #whatever it writes is committed together or rolled back together
+    async def transaction(self, function, *args):
+        self.start()
+        with metrics.Timer(metrics.db_query_latency, metrics.db_errors, ("transaction",)):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((function, args, future))
+            return await future
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            self._drain(batch)
+            if len(batch) < self.batch_size and self.flush_latency > 0:
+                await asyncio.sleep(self.flush_latency)
+                self._drain(batch)
+            try:
+                results = await loop.run_in_executor(self.write_pool, self._write_batch, batch)
+            except Exception as error:
+                results = [(None, error)] * len(batch)
+            for (_, _, future), (rowcount, error) in zip(batch, results):
+                if future.cancelled():
+                    pass
+                elif error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(rowcount)
+                self.queue.task_done()
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+    #runs in the writer thread, one transaction and one commit for the whole batch
+    def _write_batch(self, batch):
+        connection = self._connection()
+        results = []
+        for query, parameters, _ in batch:
+            try:
+                if callable(query):
+                    results.append((self._run_unit(connection, query, parameters), None))
+                else:
+                    cursor = connection.execute(query, parameters or ())
+                    results.append((cursor.rowcount, None))
+            except Exception as error:
+                #only the failed statement or unit is rolled back, the rest of the batch is kept
+                results.append((None, error))
+        try:
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+        return results
+
+    #a savepoint inside the batch transaction, so the unit can be undone without the rest of the batch
+    def _run_unit(self, connection, function, args):
+        if not connection.in_transaction:
+            connection.execute("BEGIN")
+        connection.execute("SAVEPOINT unit")
+        try:
+            result = function(connection, *args)
+        except Exception:
+            connection.execute("ROLLBACK TO unit")
+            connection.execute("RELEASE unit")
+            raise
+        connection.execute("RELEASE unit")
+        return result
+
+    #Reads
+    async def fetch_data_one(self, query, parameters=None):
+        with metrics.Timer(metrics.db_query_latency, metrics.db_errors, ("read_one",)):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.read_pool, self._fetch, query, parameters, False
+            )
+
+    async def fetch_data_all(self, query, parameters=None):
+        with metrics.Timer(metrics.db_query_latency, metrics.db_errors, ("read_all",)):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.read_pool, self._fetch, query, parameters, True
+            )
+
+    def _fetch(self, query, parameters, all_rows):
+        cursor = self._connection().execute(query, parameters or ())
+        try:
+            return cursor.fetchall() if all_rows else cursor.fetchone()
+        finally:
+            cursor.close()
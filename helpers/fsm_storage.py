@@ -0,0 +1,68 @@
+import json
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from helpers.database_connector import SQLiteConnector
+from helpers.cache import TTLCache, MISSING
+
+
+#FSM states and data kept in the bot database, so they survive a restart
+#every user is served by one process, the cache in front of the table stays consistent
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db: SQLiteConnector, cache_size: int, cache_ttl: float):
+        self.db = db
+        #storage key -> [state, data]
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+    async def init(self):
+        await self.db.execute_query(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, "
+            "state TEXT, "
+            "data TEXT NOT NULL DEFAULT '{}')"
+        )
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+    async def _load(self, key: str) -> list:
+        entry = self.cache.get(key)
+        if entry is MISSING:
+            row = await self.db.fetch_data_one("SELECT state, data FROM fsm WHERE key = ?", (key,))
+            entry = [row[0], json.loads(row[1])] if row else [None, {}]
+            self.cache.set(key, entry)
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        key = self._key(key)
+        entry = await self._load(key)
+        await self.db.execute_query(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (key, state)
+        )
+        entry[0] = state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._load(self._key(key))
+        return entry[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self._key(key)
+        entry = await self._load(key)
+        await self.db.execute_query(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (key, json.dumps(data))
+        )
+        entry[1] = data.copy()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._load(self._key(key))
+        return entry[1].copy()
+
+    #the database is closed together with the bot
+    async def close(self) -> None:
+        pass
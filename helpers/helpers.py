@@ -1,136 +1,119 @@
-import asyncio
 from helpers.database_connector import SQLiteConnector
+import asyncio
 import logging
-import ast
-from openai import OpenAI
-from aiogram import Bot, types
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton 
-import re
-#openAI
-
-client = OpenAI(api_key="")
+from helpers import openai_client, config, metrics
+from helpers.cache import TTLCache, MISSING
+from helpers.history import append_message, load_window
+from helpers.voice import VoicePipeline
+from helpers.streaming import StreamingReply, add_extra_backslash
+from helpers.tokens import count_tokens
 logging.basicConfig(level=logging.INFO)
 
 #database
-db = SQLiteConnector("database\\users.db")
-
-
-#unicode flags
-britain = u"\U0001F1EC\U0001F1E7"
-ukraine = u"\U0001F1FA\U0001F1E6"
-#Classes
-#File class that is being used to distrubute voice messages
-class File:
-    free = True
-    def isFree(self):
-        return self.free
-    
-    def switch(self):
-        if self.free == True: 
-            self.free = False
-        else:
-            self.free = True
+db = SQLiteConnector(config.DATABASE_PATH, config.DB_READERS, config.DB_BATCH_SIZE, config.DB_FLUSH_LATENCY)
+#user id -> language, written through on every change
+profiles = TTLCache(config.PROFILE_CACHE_SIZE, config.PROFILE_CACHE_TTL)
 
 
 #Functions
-#telegram keyboards
-def initialize_languages():
-    button_language_eng = KeyboardButton(text=f"{britain}")
-    button_language_ua = KeyboardButton(text=f"{ukraine}")
-    return ReplyKeyboardMarkup(keyboard=[[button_language_eng], [button_language_ua]], resize_keyboard=True, one_time_keyboard=True)
-
-
-#getting the language from db
-def get_language(id):
-    value = db.fetch_data_one("SELECT language FROM users WHERE id = ?", (id,))
-    return value[0]
+#getting the language from the cache or db
+async def get_language(id):
+    language = profiles.get(id)
+    if language is MISSING:
+        value = await db.fetch_data_one("SELECT language FROM users WHERE id = ?", (id,))
+        #unknown users aren't cached, add_user has to see them
+        if value is None:
+            return ""
+        language = value[0]
+        profiles.set(id, language)
+    return language
+
+
+async def set_language(id, language):
+    await db.execute_query("UPDATE users SET language = ? WHERE id = ?", (language, id))
+    profiles.set(id, language)
+
+
+#adding the user on the first start, known users are in the cache already
+async def add_user(id):
+    if profiles.get(id) is not MISSING:
+        return
+    value = await db.fetch_data_one("SELECT language FROM users WHERE id = ?", (id,))
+    if value is None:
+        await db.execute_query("INSERT INTO users (id, chat, language) VALUES (?,?,?)", (id, "", ""))
+        profiles.set(id, "")
+    else:
+        profiles.set(id, value[0])
           
             
 #Saving chat history (all the messages)
-def save_chat(text, role, id):
+async def save_chat(text, role, id):
     user = 'user' if role == 1 else 'assistant'
-    text = str({'role': f'{user}', 'content': f"{text}"}) + "\n" + "#123#"
-    db.execute_query("UPDATE users SET chat = chat || ? WHERE id = ?", (text, id))            
+    await append_message(db, id, user, text)
 
 
 #Function which makes the answer and saves it to the database
-def ask_and_save(user_request, id):
-    save_chat(user_request, 1, id)
-    reply = ask_chat(id)
-    save_chat(reply, 2, id)
-    return reply
-
-
-#dispense the files to load audio-data
-def dispenser(farr: list[File]):
-    for i, item in enumerate(farr):
-        if item.free == True:
-            filename = f"voice\\file_{str(i)}.mp3"
-            item.switch()
-            return [i, filename]
-    return False
-
-
-#Voice message Downloader
-async def downloader(bot: Bot, filearray: list,  message: types.Message) -> list:
-    file_id = message.voice.file_id
-    file = await bot.get_file(file_id)
-    file_path = file.file_path
-    
-    checkFree = dispenser(filearray)
-    if checkFree != False:
-        await bot.download_file(file_path, checkFree[1])
-        return checkFree
-    else:
-        while checkFree == False:
-            await asyncio.sleep(15)
-            checkFree = dispenser(filearray)
-    await bot.download_file(file_path, checkFree[1])
-    return checkFree
-
-
-#Truncate the beginning of the chat if it overflows the usage tokens
-def truncate_chat(haystack: str, needle: str, n: int) -> int:
-    start = haystack.find(needle)
-    while start >= 0 and n > 1:
-        start = haystack.find(needle, start+len(needle))
-        n -= 1
-    result = haystack[start+5:]
-    return result
+async def ask_and_save(user_request, id):
+    await save_chat(user_request, 1, id)
+    reply = await ask_chat(id)
+    await save_chat(reply, 2, id)
+    return add_extra_backslash(reply)
+
+
+#Same as ask_and_save, but the answer is shown in `reply` while it is generated
+#the stream is read in its own task, so slow edits in Telegram don't hold the OpenAI slots
+async def ask_and_stream(user_request, id, reply: StreamingReply):
+    await save_chat(user_request, 1, id)
+    messages, truncated, tokens = await load_window(db, id)
+    if truncated:
+        metrics.context_truncations.inc(labels=(config.OPENAI_MODEL,))
+    deltas = asyncio.Queue()
+    reader = asyncio.create_task(_read_stream(id, messages, deltas))
+    parts = []
+    try:
+        while (delta := await deltas.get()) is not None:
+            if isinstance(delta, Exception):
+                raise delta
+            parts.append(delta)
+            await reply.feed(delta)
+    finally:
+        reader.cancel()
+        await reply.finish()
+    result = "".join(parts)
+    metrics.openai_tokens.inc(tokens + count_tokens(result), (id, config.OPENAI_MODEL))
+    await save_chat(result, 2, id)
 
 
 #OpenAI functions
-def transcipt_file(audio_file):    
-    transcript = client.audio.transcriptions.create(
-        model="whisper-1", 
-        file=audio_file, 
-        response_format="text"
-    )
+#puts the answer into `deltas` piece by piece, then None or the error
+async def _read_stream(id, messages, deltas: asyncio.Queue):
+    try:
+        async for delta in openai_client.stream(id, messages):
+            deltas.put_nowait(delta)
+    except Exception as error:
+        deltas.put_nowait(error)
+    else:
+        deltas.put_nowait(None)
+
+
+async def transcipt_file(audio_file, id):
+    transcript = await openai_client.transcribe(id, audio_file)
     return transcript
 
+
+#voice messages are queued here and transcribed in memory
+voice_pipeline = VoicePipeline(transcipt_file, config.VOICE_WORKERS, config.VOICE_QUEUE_SIZE)
+
+
 #ChatGPT prompt and parsing answer
-def ask_chat(id):
-    #getting data in an array of dictionaries
-    messages = []
-    request_db = "".join(db.fetch_data_one("SELECT chat FROM users WHERE id = ?", (id,))).split('#123#')
-    request_db.pop()
-    for item in request_db:
-        messages.append(ast.literal_eval(item))
-    response = client.chat.completions.create(model='gpt-3.5-turbo', messages=messages)
-    #checking for tokens used
-    usage = response.usage.total_tokens
-    if usage >= 3500:
-        chat = db.fetch_data_one("SELECT chat FROM users WHERE id = ?", (id,))[0]
-        db.execute_query("UPDATE users SET chat = ? WHERE id = ?", (truncate_chat(chat, "#123#", 4),id))
+async def ask_chat(id):
+    #getting the newest messages that fit the context as an array of dictionaries
+    messages, truncated, tokens = await load_window(db, id)
+    if truncated:
+        metrics.context_truncations.inc(labels=(config.OPENAI_MODEL,))
+    response = await openai_client.complete(id, messages)
     result = response.choices[0].message.content
-    result = add_extra_backslash(result)
     return result
 
 
-#escaping special symbols for MarkdownV2
-def add_extra_backslash(text):
-    special_characters = r'[.\-/~>=*#+?!^${}()|\[\]\\]'
-    replaced_text = re.sub(special_characters, r'\\\g<0>', text)
-    return replaced_text
-
 
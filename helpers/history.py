@@ -0,0 +1,145 @@
+import ast
+from functools import lru_cache
+from helpers.database_connector import SQLiteConnector
+from helpers import config
+from helpers.tokens import count_tokens, truncate_tokens, context_budget, MESSAGE_OVERHEAD, REPLY_OVERHEAD
+
+#Chat history, one row per message
+#(user_id, seq) is the primary key, so appending and reading the tail are index lookups
+#token counts are stored with the message, nothing is tokenized twice
+
+#rows read at once while filling the context window
+WINDOW_PAGE = 32
+
+
+#a new database gets the users table too
+async def init_history(db: SQLiteConnector):
+    await db.execute_query("CREATE TABLE IF NOT EXISTS users (id INT not NULL, chat TEXT, language TEXT)")
+    await db.execute_query(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "user_id INTEGER NOT NULL, "
+        "seq INTEGER NOT NULL, "
+        "role TEXT NOT NULL, "
+        "content TEXT NOT NULL, "
+        "tokens INTEGER NOT NULL, "
+        "PRIMARY KEY (user_id, seq)) WITHOUT ROWID"
+    )
+
+
+#the message gets the next seq of the user
+APPEND_QUERY = (
+    "INSERT INTO messages (user_id, seq, role, content, tokens) "
+    "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM messages WHERE user_id = ?"
+)
+
+
+async def append_message(db: SQLiteConnector, id, role: str, content: str):
+    await db.execute_query(APPEND_QUERY, (id, role, content, count_tokens(content), id))
+
+
+#Newest messages that fit the token budget of the model, in chronological order
+#the history is read from the end page by page and only until the budget is spent
+#the newest message is always sent, cut down to the budget when it is too long alone
+#returns the messages, whether older ones were left out and the prompt tokens
+async def load_window(db: SQLiteConnector, id, model: str = config.OPENAI_MODEL) -> tuple[list[dict], bool, int]:
+    limit = context_budget(model)
+    budget = limit - REPLY_OVERHEAD
+    system = None
+    if config.SYSTEM_PROMPT:
+        system = {'role': 'system', 'content': config.SYSTEM_PROMPT}
+        if config.PIN_SYSTEM_PROMPT:
+            budget -= system_tokens(model)
+
+    window = []
+    truncated = False
+    last_seq = None
+    while not truncated:
+        if last_seq is None:
+            rows = await db.fetch_data_all(
+                "SELECT seq, role, content, tokens FROM messages WHERE user_id = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (id, WINDOW_PAGE)
+            )
+        else:
+            rows = await db.fetch_data_all(
+                "SELECT seq, role, content, tokens FROM messages WHERE user_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (id, last_seq, WINDOW_PAGE)
+            )
+        for seq, role, content, tokens in rows:
+            cost = tokens + MESSAGE_OVERHEAD
+            if cost > budget:
+                truncated = True
+                if not window:
+                    content = truncate_tokens(content, max(budget - MESSAGE_OVERHEAD, 1), model)
+                    budget -= count_tokens(content, model) + MESSAGE_OVERHEAD
+                    window.append({'role': role, 'content': content})
+                break
+            budget -= cost
+            window.append({'role': role, 'content': content})
+        if len(rows) < WINDOW_PAGE:
+            break
+        last_seq = rows[-1][0]
+    window.reverse()
+
+    if system is not None:
+        if config.PIN_SYSTEM_PROMPT:
+            window.insert(0, system)
+        elif not truncated and system_tokens(model) <= budget:
+            window.insert(0, system)
+            budget -= system_tokens(model)
+        else:
+            truncated = True
+    return window, truncated, limit - budget
+
+
+#the system prompt doesn't change, it is counted once per model
+@lru_cache(maxsize=None)
+def system_tokens(model: str) -> int:
+    return count_tokens(config.SYSTEM_PROMPT, model) + MESSAGE_OVERHEAD
+
+
+async def clear_history(db: SQLiteConnector, id):
+    await db.execute_query("DELETE FROM messages WHERE user_id = ?", (id,))
+
+
+#Parsing the old users.chat format: str(dict) fragments joined with "#123#"
+def parse_legacy_chat(chat: str) -> list[dict]:
+    messages = []
+    fragments = chat.split('#123#')
+    fragments.pop()
+    buffer = None
+    for fragment in fragments:
+        #the delimiter could be a part of a message, glue the pieces back together
+        buffer = fragment if buffer is None else buffer + '#123#' + fragment
+        try:
+            message = ast.literal_eval(buffer.strip())
+        except (ValueError, SyntaxError):
+            continue
+        messages.append(message)
+        buffer = None
+    return messages
+
+
+#One-shot move of users.chat into the messages table, safe to run on every start
+#every chat is claimed and copied in one transaction, so when several processes start only one moves it,
+#and a chat is never cleared without its messages being saved
+async def migrate_legacy_chat(db: SQLiteConnector) -> int:
+    moved = 0
+    rows = await db.fetch_data_all("SELECT id, chat FROM users WHERE chat IS NOT NULL AND chat != ''")
+    for id, chat in rows:
+        moved += await db.transaction(_move_legacy_chat, id, chat)
+    return moved
+
+
+#runs in the writer thread, nothing is moved when another process has claimed the chat already
+def _move_legacy_chat(connection, id, chat: str) -> int:
+    claimed = connection.execute("UPDATE users SET chat = ? WHERE id = ? AND chat = ?", ("", id, chat)).rowcount
+    if not claimed:
+        return 0
+    messages = parse_legacy_chat(chat)
+    connection.executemany(APPEND_QUERY, [
+        (id, message['role'], message['content'], count_tokens(message['content']), id)
+        for message in messages
+    ])
+    return len(messages)
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from helpers import metrics
+
+
+#Latency and errors of every message handler, labelled with the handler name
+#registered as an inner middleware, so it only runs for the handler that matched
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        with metrics.Timer(metrics.handler_latency, metrics.handler_errors, (name,)):
+            return await handler(event, data)
+
+
+async def metrics_handler(request: web.Request):
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+#serves /metrics on its own port, returns the runner to clean up on shutdown
+async def serve_metrics(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+#writes a summary of the metrics to the log every `interval` seconds
+async def log_summary(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        logging.info("metrics: %s", metrics.summary())
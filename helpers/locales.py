@@ -0,0 +1,60 @@
+import os
+import i18n
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+#Localized strings and keyboards, built once for every locale file on start
+KEYS = ("start_chat", "end_chat", "you_are_welcome", "finish", "use", "info", "select", "support", "error")
+#keys that have their own one-button keyboard
+BUTTONS = ("start_chat", "end_chat")
+
+strings = {}
+keyboards = {}
+#flag on the language keyboard -> locale
+flags = {}
+
+
+def available_locales(path: str) -> list[str]:
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(path) if name.endswith(".json"))
+
+
+def build(path: str):
+    for locale in available_locales(path):
+        strings[locale] = {key: i18n.t(key, locale=locale) for key in KEYS}
+        flags[i18n.t("flag", locale=locale)] = locale
+        keyboards[locale] = {
+            key: ReplyKeyboardMarkup(
+                keyboard=[[KeyboardButton(text=strings[locale][key])]],
+                resize_keyboard=True, one_time_keyboard=True
+            )
+            for key in BUTTONS
+        }
+
+
+#users who haven't selected a language yet get the fallback one
+def _locale(locale: str) -> str:
+    return locale if locale in strings else i18n.get("fallback")
+
+
+def text(locale: str, key: str) -> str:
+    return strings[_locale(locale)][key]
+
+
+def keyboard(locale: str, key: str) -> ReplyKeyboardMarkup:
+    return keyboards[_locale(locale)][key]
+
+
+#Button texts of every locale, so one hash lookup matches a button in any language
+def button_texts(key: str) -> frozenset:
+    return frozenset(strings[locale][key] for locale in strings)
+
+
+def language_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=flag)] for flag in flags],
+        resize_keyboard=True, one_time_keyboard=True
+    )
+
+
+#the fallback locale for anything that isn't a known flag
+def locale_by_flag(flag: str) -> str:
+    return flags.get(flag, i18n.get("fallback"))
@@ -0,0 +1,152 @@
+import time
+from bisect import bisect_left
+
+#In-process metrics, cheap enough to update on every message
+#values are kept per tuple of label values and rendered in the Prometheus text format
+
+#seconds, from a cached language lookup to a long completion
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+registry = []
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        registry.append(self)
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, value in self.values.items():
+            lines.append(f"{self.name}{self._label_text(values)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, labels: tuple = ()):
+        self.values[labels] = value
+
+    @property
+    def value(self) -> float:
+        return self.values.get((), 0)
+
+
+#every label set keeps [count per bucket, sum, count], buckets are cumulated on render
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, labels: tuple = ()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @property
+    def count(self) -> int:
+        return sum(entry[2] for entry in self.values.values())
+
+    @property
+    def average(self) -> float:
+        count = self.count
+        return sum(entry[1] for entry in self.values.values()) / count if count else 0.0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#Short text for the log: count and average of every latency, totals of the counters
+def summary() -> str:
+    parts = []
+    for metric in registry:
+        if isinstance(metric, Histogram):
+            for values, (_, total, count) in metric.values.items():
+                name = metric.name + metric._label_text(values)
+                parts.append(f"{name} n={count} avg={total / count * 1000:.1f}ms")
+        elif isinstance(metric, Counter) and metric.values:
+            parts.append(f"{metric.name}={metric.total():g}")
+    return "; ".join(parts)
+
+
+#Handlers
+handler_latency = Histogram("bot_handler_seconds", "Time spent in a message handler", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Message handlers that raised", ("handler",))
+
+#Database
+db_query_latency = Histogram("bot_db_query_seconds", "SQLite calls including the wait for the writer or a reader", ("operation",))
+db_errors = Counter("bot_db_errors_total", "SQLite calls that failed", ("operation",))
+
+#OpenAI
+openai_latency = Histogram("bot_openai_request_seconds", "OpenAI requests", ("endpoint", "model"))
+openai_errors = Counter("bot_openai_errors_total", "OpenAI requests that failed", ("endpoint", "model"))
+openai_tokens = Counter("bot_openai_tokens_total", "Tokens used, estimated for streamed answers", ("user", "model"))
+context_truncations = Counter("bot_context_truncations_total", "Prompts that left out older messages to fit the budget", ("model",))
+
+#voice messages waiting for a worker
+voice_queue_depth = Gauge("bot_voice_queue_depth", "Voice messages waiting for a transcription worker")
+#from the moment a voice message is queued until its text is ready
+time_to_transcript = Histogram("bot_voice_time_to_transcript_seconds", "From queueing a voice message to its text")
+#from the moment a prompt is received until the first words of the answer are shown
+time_to_first_token = Histogram("bot_time_to_first_token_seconds", "From a prompt to the first visible words of the answer")
+
+
+#times a block into a histogram, errors are counted as well
+class Timer:
+    def __init__(self, histogram: Histogram, errors: Counter, labels: tuple = ()):
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+        if error_type is not None and issubclass(error_type, Exception):
+            self.errors.inc(labels=self.labels)
+        return False
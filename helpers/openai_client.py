@@ -0,0 +1,69 @@
+import asyncio
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI
+from helpers import config, metrics
+
+
+#Limits the requests in flight for the whole bot and for every user
+class RequestLimiter:
+    def __init__(self, global_limit: int, per_user_limit: int):
+        self.global_slots = asyncio.Semaphore(global_limit)
+        self.per_user_limit = per_user_limit
+        #id -> [semaphore, number of coroutines using it]
+        self.users = {}
+
+    @asynccontextmanager
+    async def slot(self, id):
+        entry = self.users.get(id)
+        if entry is None:
+            entry = self.users[id] = [asyncio.Semaphore(self.per_user_limit), 0]
+        entry[1] += 1
+        try:
+            #user slot first, so a busy user doesn't hold a global one while waiting
+            async with entry[0]:
+                async with self.global_slots:
+                    yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.users[id]
+
+
+#timeouts and retries with backoff are handled by the client itself
+client = AsyncOpenAI(
+    api_key=config.OPENAI_API_KEY,
+    base_url=config.OPENAI_BASE_URL,
+    timeout=config.OPENAI_TIMEOUT,
+    max_retries=config.OPENAI_MAX_RETRIES
+)
+limiter = RequestLimiter(config.OPENAI_MAX_CONCURRENCY, config.OPENAI_MAX_PER_USER)
+
+
+async def complete(id, messages, model=config.OPENAI_MODEL):
+    async with limiter.slot(id):
+        with metrics.Timer(metrics.openai_latency, metrics.openai_errors, ("chat", model)):
+            response = await client.chat.completions.create(model=model, messages=messages)
+    if response.usage:
+        metrics.openai_tokens.inc(response.usage.total_tokens, (id, model))
+    return response
+
+
+#yields the answer piece by piece while it is generated
+#streamed answers don't report usage, the caller counts their tokens
+async def stream(id, messages, model=config.OPENAI_MODEL):
+    async with limiter.slot(id):
+        with metrics.Timer(metrics.openai_latency, metrics.openai_errors, ("chat_stream", model)):
+            response = await client.chat.completions.create(model=model, messages=messages, stream=True)
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+async def transcribe(id, audio_file):
+    async with limiter.slot(id):
+        with metrics.Timer(metrics.openai_latency, metrics.openai_errors, ("transcription", "whisper-1")):
+            return await client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="text"
+            )
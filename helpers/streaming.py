@@ -0,0 +1,111 @@
+import asyncio
+import re
+import time
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from helpers import metrics
+
+#Telegram doesn't accept longer messages
+MESSAGE_LIMIT = 4096
+PLACEHOLDER = "…"
+
+
+#escaping special symbols for MarkdownV2, every reserved one is escaped,
+#so a half-written entity in the middle of a streamed answer can't break the markup
+def add_extra_backslash(text):
+    special_characters = r'[_*\[\]()~`>#+\-=|{}.!/?^$\\]'
+    replaced_text = re.sub(special_characters, r'\\\g<0>', text)
+    return replaced_text
+
+
+#Reply that grows while the answer is generated
+#a placeholder is sent right away, the first text is shown at once and later edits come at most once per `interval` seconds,
+#text over the Telegram limit goes on in a new message
+class StreamingReply:
+    #`started` is the time.perf_counter() the prompt came at, the time to the first words is measured from it
+    def __init__(self, message: types.Message, interval: float, started: float):
+        self.message = message
+        self.interval = interval
+        #bot message being edited, None until the next part is sent
+        self.sent = None
+        #raw text of the current message and the length it has after escaping
+        self.raw = ""
+        self.length = 0
+        #escaped text Telegram shows right now
+        self.shown = PLACEHOLDER
+        self.last_edit = 0.0
+        self.started = started
+        self.first_visible = False
+
+    #the placeholder doesn't count as an edit, the first words replace it as soon as they come
+    async def start(self):
+        self.sent = await self.message.reply(PLACEHOLDER)
+
+    async def feed(self, delta: str):
+        size = len(add_extra_backslash(delta))
+        if self.length + size <= MESSAGE_LIMIT:
+            self.raw += delta
+            self.length += size
+        else:
+            #one character at a time, so an escape sequence is never cut in half
+            for char in delta:
+                size = len(add_extra_backslash(char))
+                if self.length + size > MESSAGE_LIMIT:
+                    await self._next_message()
+                self.raw += char
+                self.length += size
+        if time.monotonic() - self.last_edit >= self.interval:
+            await self._edit()
+
+    async def finish(self):
+        await self._edit(final=True)
+
+    #the answer failed, a placeholder without any text turns into `text`
+    async def fail(self, text: str):
+        if self.sent is not None and self.shown == PLACEHOLDER:
+            await self.sent.edit_text(text)
+            self.shown = text
+
+    #closing the current message, on a line break when there is one in its second half
+    async def _next_message(self):
+        cut = self.raw.rfind("\n", len(self.raw) // 2) + 1 or len(self.raw)
+        self.raw, tail = self.raw[:cut], self.raw[cut:]
+        await self._edit(final=True)
+        self.sent = None
+        self.raw = tail
+        self.length = len(add_extra_backslash(tail))
+        self.shown = ""
+
+    async def _edit(self, final: bool = False):
+        text = add_extra_backslash(self.raw)
+        if not self.raw or text == self.shown:
+            return
+        parse_mode = "MarkdownV2"
+        while True:
+            try:
+                await self._show(text if parse_mode else self.raw, parse_mode)
+                break
+            except TelegramRetryAfter as error:
+                if not final:
+                    self.last_edit = time.monotonic() + error.retry_after
+                    return
+                await asyncio.sleep(error.retry_after)
+            except TelegramBadRequest:
+                #markup can be broken in the middle of the answer, the last edit goes as plain text
+                if not final:
+                    self.last_edit = time.monotonic()
+                    return
+                if parse_mode is None:
+                    raise
+                parse_mode = None
+        self.shown = text
+        self.last_edit = time.monotonic()
+        if not self.first_visible:
+            self.first_visible = True
+            metrics.time_to_first_token.observe(time.perf_counter() - self.started)
+
+    async def _show(self, text: str, parse_mode):
+        if self.sent is None:
+            self.sent = await self.message.answer(text, parse_mode=parse_mode)
+        else:
+            await self.sent.edit_text(text, parse_mode=parse_mode)
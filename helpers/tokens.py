@@ -0,0 +1,63 @@
+import logging
+from functools import lru_cache
+from helpers import config
+
+#tiktoken is optional, without it the count is a conservative estimate
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+#every message costs a few tokens on top of its content
+MESSAGE_OVERHEAD = 4
+#the reply is primed with a few tokens as well
+REPLY_OVERHEAD = 3
+
+
+#None when tiktoken is missing or can't load its files, the count is estimated then
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        #the encodings are downloaded on first use, without network they can be missing
+        logging.warning("tiktoken encoding for %s is not available, token counts are estimated", model)
+        return None
+
+
+#rough count that rather overshoots: about three characters per token for english text, less for code and numbers,
+#other scripts take up to a token per character, two bytes of utf-8 are a safe bound
+def _estimate(text: str) -> int:
+    if text.isascii():
+        return len(text) // 3 + 1
+    return max(len(text) // 3, len(text.encode("utf-8")) // 2) + 1
+
+
+def count_tokens(text: str, model: str = config.OPENAI_MODEL) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return _estimate(text)
+    return len(encoding.encode(text))
+
+
+#the beginning of the text that fits into `tokens`
+def truncate_tokens(text: str, tokens: int, model: str = config.OPENAI_MODEL) -> str:
+    encoding = _encoding(model)
+    if encoding is None:
+        end = len(text) * tokens // _estimate(text)
+        while end > 0 and _estimate(text[:end]) > tokens:
+            end -= max(1, end // 10)
+        return text[:end]
+    return encoding.decode(encoding.encode(text)[:tokens])
+
+
+#prompt budget for the model, what is left of the context goes to the reply
+def context_budget(model: str = config.OPENAI_MODEL) -> int:
+    if config.CONTEXT_BUDGET:
+        return config.CONTEXT_BUDGET
+    return config.CONTEXT_BUDGETS.get(model, config.CONTEXT_BUDGETS["gpt-3.5-turbo"])
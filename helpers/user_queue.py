@@ -0,0 +1,99 @@
+import asyncio
+import inspect
+import time
+
+
+class _UserQueue:
+    def __init__(self):
+        #(message, text or awaitable text, future of the caller, time.perf_counter() when it came)
+        self.items = []
+        self.arrived = asyncio.Event()
+        self.task = None
+
+
+#Prompts of one user are answered one after another, different users run in parallel
+#texts that come within `window` seconds of each other are answered with one completion,
+#but the first of them never waits longer than `max_delay`
+#the queue of a user is dropped as soon as it is empty
+class UserSerializer:
+    def __init__(self, process, window: float, max_delay: float):
+        #async function (last message, merged text, user id, time the first message of the batch came)
+        self.process = process
+        self.window = window
+        self.max_delay = max_delay
+        self.users = {}
+
+    #`text` can be awaitable, e.g. a transcription that is still running, the order is kept anyway
+    async def submit(self, id, message, text):
+        user = self.users.get(id)
+        if user is None:
+            user = self.users[id] = _UserQueue()
+        future = asyncio.get_running_loop().create_future()
+        user.items.append((message, text, future, time.perf_counter()))
+        user.arrived.set()
+        if user.task is None:
+            user.task = asyncio.create_task(self._run(id, user))
+        return await future
+
+    #Drops the prompts of the user that haven't been answered yet and waits for the one in progress
+    #their callers return as if they were answered, transcriptions still running are cancelled
+    async def drop(self, id):
+        user = self.users.get(id)
+        if user is None:
+            return
+        items, user.items = user.items, []
+        for _, text, future, _ in items:
+            if isinstance(text, asyncio.Future):
+                text.cancel()
+            if not future.done():
+                future.set_result(None)
+        user.arrived.set()
+        await asyncio.wait({user.task})
+
+    async def _run(self, id, user):
+        try:
+            while user.items:
+                await self._wait_for_quiet(user)
+                batch, user.items = user.items, []
+                await self._answer(id, batch)
+        finally:
+            del self.users[id]
+
+    async def _wait_for_quiet(self, user):
+        deadline = time.monotonic() + self.max_delay
+        while True:
+            user.arrived.clear()
+            timeout = min(self.window, deadline - time.monotonic())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(user.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def _answer(self, id, batch):
+        texts = []
+        waiting = []
+        for message, text, future, _ in batch:
+            try:
+                if inspect.isawaitable(text):
+                    text = await text
+            except Exception as error:
+                #only the message that failed gets the error
+                if not future.done():
+                    future.set_exception(error)
+                continue
+            texts.append(text)
+            waiting.append((message, future))
+        if not texts:
+            return
+        try:
+            await self.process(waiting[-1][0], "\n".join(texts), id, batch[0][3])
+        except Exception as error:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for _, future in waiting:
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,63 @@
+import asyncio
+import io
+import time
+from aiogram import Bot, types
+from helpers import metrics
+
+
+#Voice messages are downloaded into memory and transcribed by a fixed number of workers
+#a full queue makes new messages wait in submit(), nothing touches the disk
+class VoicePipeline:
+    def __init__(self, transcribe, workers: int, queue_size: int):
+        #async function (audio_file, user id) -> text
+        self.transcribe = transcribe
+        self.workers_count = workers
+        self.queue_size = queue_size
+        self.queue = None
+        self.workers = []
+
+    def start(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+        while len(self.workers) < self.workers_count:
+            self.workers.append(asyncio.create_task(self._worker()))
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+
+    async def submit(self, bot: Bot, message: types.Message) -> str:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((bot, message, future, time.perf_counter()))
+        metrics.voice_queue_depth.set(self.queue.qsize())
+        return await future
+
+    async def _worker(self):
+        while True:
+            bot, message, future, queued = await self.queue.get()
+            metrics.voice_queue_depth.set(self.queue.qsize())
+            try:
+                #the handler could be gone already, no need to spend a request then
+                if not future.done():
+                    text = await self._process(bot, message)
+                    if not future.done():
+                        future.set_result(text)
+                    metrics.time_to_transcript.observe(time.perf_counter() - queued)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, bot: Bot, message: types.Message) -> str:
+        buffer = io.BytesIO()
+        try:
+            await bot.download(message.voice, destination=buffer)
+            buffer.seek(0)
+            #the name tells the API the format of the audio
+            return await self.transcribe(("voice.ogg", buffer), message.from_user.id)
+        finally:
+            buffer.close()
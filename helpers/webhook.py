@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+#header Telegram sends the secret token in
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+#user the update came from, 0 for the updates without one
+def update_user_id(update: dict) -> int:
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user") or value.get("chat")
+            if user:
+                return user["id"]
+    return 0
+
+
+#the same user always goes to the same worker, so their state stays in one process
+def shard(update: dict, workers: int) -> int:
+    return update_user_id(update) % workers
+
+
+async def serve(app: web.Application, host: str, port: int):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+#One process: aiogram handles the webhook requests itself
+#every update is answered right away and handled in the background, a long completion doesn't keep Telegram waiting
+async def run_webhook(dp: Dispatcher, bot: Bot, host: str, port: int, path: str, secret: str):
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, handle_in_background=True, secret_token=secret or None
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    await serve(app, host, port)
+
+
+#Several processes: this one only receives the updates and passes them to the workers by user id
+#`target(queue, index)` runs a worker, it has to be importable by a new process
+async def run_sharded(target, workers: int, host: str, port: int, path: str, secret: str):
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(workers)]
+    processes = [
+        context.Process(target=target, args=(queue, index), daemon=True)
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    async def handle(request: web.Request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        update = await request.json()
+        queues[shard(update, workers)].put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    try:
+        await serve(app, host, port)
+    finally:
+        for queue in queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+
+
+#Worker process: feeds the updates of its shard to the dispatcher until None comes
+async def run_shard(dp: Dispatcher, bot: Bot, queue):
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    await dp.emit_startup(bot=bot)
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:
+                break
+            task = asyncio.create_task(dp.feed_raw_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()